@@ -11,6 +11,7 @@ import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+import torch.nn.utils.parametrize as parametrize
 import torchaudio
 from torch.utils.data import DataLoader, Dataset, random_split
 from torchaudio.transforms import AmplitudeToDB, MelSpectrogram
@@ -43,6 +44,9 @@ print("torch:", torch.__version__, "cuda:", torch.cuda.is_available())
 print("torchaudio:", getattr(torchaudio, "__version__", "unknown"))
 
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+# bf16 autocast for the training step where the GPU supports it natively (Ampere+); emulated bf16
+# on older GPUs (e.g. T4/P100) would be slower than plain fp32
+use_amp = device.type == "cuda" and torch.cuda.is_bf16_supported(including_emulation=False)
 
 
 class Dataset(Dataset):
@@ -52,30 +56,81 @@ class Dataset(Dataset):
             raise FileNotFoundError(f"No .wav files found in {targ_dir}")
         # labels extracted from filename like '3_jackson_45.wav'
         self.labels = [int(path.stem.split("_")[0]) for path in self.paths]
+        # FSDD is ~10MB of audio: decode every wav once here instead of on every access / epoch
+        self.waveforms = [torchaudio.load(path, normalize=True)[0] for path in self.paths]
         self.transform = transform
         self.max_length = max_length
+        # build transforms once; MelSpectrogram allocates its window and mel filterbank on construction
+        # notebook uses sample_rate=32000 here (even though FSDD is typically 8000)
+        self.mel_spec = MelSpectrogram(sample_rate=8000, n_fft=256, hop_length=128, n_mels=32)
+        self.amp2db = AmplitudeToDB()
+        self.cache = None
+
+    @torch.no_grad()
+    def precompute_all(self, device, batch_size: int = 512):
+        # run the __getitem__ transform pipeline for every clip once, in padded batches on `device`.
+        # each clip is reflect-padded by n_fft//2 itself (what center=True does per sample), so the
+        # frames that belong to a clip are identical to the per-sample result; frames that only see
+        # the zero padding added for batching are masked out of the normalization statistics.
+        if not self.transform:
+            return None
+        n_fft, hop_length = self.mel_spec.n_fft, self.mel_spec.hop_length
+        # reuse the Hann window and mel filterbank already built for self.mel_spec
+        window = self.mel_spec.spectrogram.window.to(device)
+        mel_fb = self.mel_spec.mel_scale.fb.to(device)  # (n_freqs, n_mels)
+        amp2db = self.amp2db.to(device)
+
+        cache = []
+        for start in range(0, len(self), batch_size):
+            waveforms = [self.load_audio(i) for i in range(start, min(start + batch_size, len(self)))]
+            lengths = torch.tensor([w.shape[-1] for w in waveforms], device=device)
+            batch = torch.zeros(len(waveforms), 1, int(lengths.max()) + n_fft, device=device)
+            for i, w in enumerate(waveforms):
+                w = F.pad(w.to(device).unsqueeze(0), (n_fft // 2, n_fft // 2), mode="reflect").squeeze(0)
+                batch[i, :, :w.shape[-1]] = w
+
+            # one batched STFT, |X|^2 as re^2 + im^2 (no sqrt then square), then a single GEMM
+            # against the filterbank: the same power mel-spectrogram MelSpectrogram produces
+            stft = torch.stft(batch.squeeze(1), n_fft, hop_length=hop_length, window=window,
+                              center=False, return_complex=True)  # (B, n_freqs, frames)
+            power = torch.view_as_real(stft).pow(2).sum(-1)
+            spec = amp2db(torch.matmul(power.transpose(1, 2), mel_fb).transpose(1, 2)).unsqueeze(1)  # (B, 1, n_mels, frames)
+            n_frames = lengths // hop_length + 1
+            mask = (torch.arange(spec.shape[-1], device=device) < n_frames[:, None]).view(-1, 1, 1, spec.shape[-1])
+            count = (n_frames * spec.shape[-2]).view(-1, 1, 1, 1)
+
+            # masked per-sample mean / unbiased std, as waveform.mean() / waveform.std() in __getitem__
+            mean = (spec * mask).sum(dim=(1, 2, 3), keepdim=True) / count
+            var = (((spec - mean) * mask) ** 2).sum(dim=(1, 2, 3), keepdim=True) / (count - 1)
+            spec = (spec - mean) / (var.sqrt() + 1e-8) * mask
+
+            # pad/trim to max_length on time axis; masked frames are already the zero padding
+            if spec.shape[-1] < self.max_length:
+                spec = F.pad(spec, (0, self.max_length - spec.shape[-1]))
+            cache.append(spec[..., :self.max_length].squeeze(1))
+
+        self.cache = torch.cat(cache)
+        return self.cache
 
     def load_audio(self, index: int):
-        audio_path = self.paths[index]
-        waveform, sample_rate = torchaudio.load(audio_path, normalize=True)
-        return waveform  # note: does not return sample_rate (same as notebook)
+        return self.waveforms[index]  # note: does not return sample_rate (same as notebook)
 
     def __len__(self) -> int:
         return len(self.paths)
 
     def __getitem__(self, index: int) -> Tuple[torch.Tensor, int]:
-        waveform = self.load_audio(index)
         label = self.labels[index]
+        if self.cache is not None:
+            return self.cache[index], label
+
+        waveform = self.load_audio(index)
 
         if self.transform:
-            # notebook uses sample_rate=32000 here (even though FSDD is typically 8000)
-            mel_spec_transform = MelSpectrogram(sample_rate=8000, n_fft=256, hop_length=128, n_mels=32)
-            amp2db_transform = AmplitudeToDB()
-            waveform = mel_spec_transform(waveform)
-            waveform = amp2db_transform(waveform)
+            waveform = self.amp2db(self.mel_spec(waveform))
 
-            # normalize per-sample
-            waveform = (waveform - waveform.mean()) / (waveform.std() + 1e-8)
+            # normalize per-sample; std_mean gets both statistics from one reduction
+            std, mean = torch.std_mean(waveform)
+            waveform = (waveform - mean) / (std + 1e-8)
 
             # pad/trim to max_length on time axis (last dim)
             if waveform.shape[-1] < self.max_length:
@@ -98,44 +153,53 @@ gamma = 0.5
 surroguate_type = "G"  # default in notebook
 
 def gaussian(x, mu=0., sigma=0.5):
-    return torch.exp(-((x - mu) ** 2) / (2 * sigma ** 2)) / torch.sqrt(2 * torch.tensor(math.pi)) / sigma
-
-
-class AcFun_adp(torch.autograd.Function):
-    @staticmethod
-    def forward(ctx, input):  # input = membrane potential - threshold
-        ctx.save_for_backward(input)
-        return input.gt(0).float()
-
-    @staticmethod
-    def backward(ctx, grad_output):  # approximate the gradients
-        input, = ctx.saved_tensors
-        grad_input = grad_output.clone()
-
-        scale = 6.0
-        height = 0.15
-        if surroguate_type == "G":
-            temp = torch.exp(-(input ** 2) / (2 * lens ** 2)) / torch.sqrt(2 * torch.tensor(math.pi)) / lens
-        elif surroguate_type == "MG":
-            temp = gaussian(input, mu=0., sigma=lens) * (1.0 + height) \
-                   - gaussian(input, mu=lens, sigma=scale * lens) * height \
-                   - gaussian(input, mu=-lens, sigma=scale * lens) * height
-        elif surroguate_type == "linear":
-            temp = F.relu(1 - input.abs())
-        elif surroguate_type == "slayer":
-            temp = torch.exp(-5 * input.abs())
-        elif surroguate_type == "sigmoid":
-            temp = torch.exp(-input) / (1 + torch.exp(-input)) ** 2
-        else:
-            temp = torch.exp(-input.abs())
-        return grad_input * temp.float() * gamma
-
-
+    return torch.exp(-((x - mu) ** 2) / (2 * sigma ** 2)) / math.sqrt(2 * math.pi) / sigma
+
+
+def make_acfun(surrogate_type, lens, gamma):
+    # the surrogate and its constants are fixed when the model is built, so backward runs a
+    # single expression with no per-call string compare or torch.tensor(math.pi) allocation
+    scale = 6.0
+    height = 0.15
+    if surrogate_type == "G":
+        inv_2lens2 = 1.0 / (2 * lens * lens)
+        norm = gamma / (math.sqrt(2 * math.pi) * lens)
+        surrogate = lambda x: torch.exp(-x * x * inv_2lens2) * norm
+    elif surrogate_type == "MG":
+        surrogate = lambda x: (gaussian(x, mu=0., sigma=lens) * (1.0 + height)
+                               - gaussian(x, mu=lens, sigma=scale * lens) * height
+                               - gaussian(x, mu=-lens, sigma=scale * lens) * height) * gamma
+    elif surrogate_type == "linear":
+        surrogate = lambda x: F.relu(1 - x.abs()) * gamma
+    elif surrogate_type == "slayer":
+        surrogate = lambda x: torch.exp(-5 * x.abs()) * gamma
+    elif surrogate_type == "sigmoid":
+        surrogate = lambda x: torch.exp(-x) / (1 + torch.exp(-x)) ** 2 * gamma
+    else:
+        surrogate = lambda x: torch.exp(-x.abs()) * gamma
+
+    class AcFun_adp(torch.autograd.Function):
+        @staticmethod
+        def forward(ctx, input):  # input = membrane potential - threshold
+            ctx.save_for_backward(input)
+            return input.gt(0).float()
+
+        @staticmethod
+        def backward(ctx, grad_output):  # approximate the gradients
+            input, = ctx.saved_tensors
+            return grad_output * surrogate(input).float()
+
+    return AcFun_adp
+
+
+AcFun_adp = make_acfun(surroguate_type, lens, gamma)
 act_fun_adp = AcFun_adp.apply
 
 
-def LIF_mem_update(inputs, mem, spike):
+def _LIF_mem_update(inputs, mem, spike):
     # mem = mem * decay * (1. - spike) + inputs
+    # membrane arithmetic stays fp32 under autocast: the 2**-14 grid below is finer than bf16
+    inputs, mem, spike = inputs.float(), mem.float(), spike.float()
     n = float(2 ** 14)
     mem = mem * decay * (1. - spike)
     mem = torch.clip(torch.round(mem * n) / n, -14.99993896484375, 14.99993896484375)
@@ -147,6 +211,14 @@ def LIF_mem_update(inputs, mem, spike):
     return mem, spike
 
 
+LIF_mem_update = _LIF_mem_update
+if device.type == "cuda" and hasattr(torch, "compile"):
+    # let inductor fuse the decay/round/clip/add/round/clip/threshold chain into a single kernel
+    # (one pass over mem instead of a launch + round-trip per op). dynamic=True because it is
+    # called with both (batch, time, d_model) and (batch, hidden) shapes and a ragged last batch.
+    LIF_mem_update = torch.compile(_LIF_mem_update, dynamic=True)
+
+
 # -------------------------
 # Quantize / Binarize
 # -------------------------
@@ -159,39 +231,116 @@ def Binarize(tensor):
     return Quantize(tensor, 16)
 
 
+class BinarizeSTE(torch.autograd.Function):
+    # Binarize in forward, identity (straight-through) gradient in backward: torch.round has zero
+    # gradient, so without this the latent fp32 weight would never receive an update
+    @staticmethod
+    def forward(ctx, input):
+        return Binarize(input)
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        return grad_output
+
+
+class BinarizeParam(nn.Module):
+    def forward(self, w):
+        return BinarizeSTE.apply(w)
+
+
 class BinarizeLinear(nn.Linear):
     def __init__(self, *kargs, **kwargs):
         super(BinarizeLinear, self).__init__(*kargs, **kwargs)
+        # self.weight is now Binarize(parametrizations.weight.original), recomputed from the trained
+        # fp32 weight on access; no shadow copy and no writes to weight.data
+        parametrize.register_parametrization(self, "weight", BinarizeParam())
+        # frozen binarized weight used in eval mode, see prepare_inference(); a non-persistent buffer so
+        # .to() / .cuda() / .double() move and cast it together with the parameters
+        self.register_buffer("_bin_weight", None, persistent=False)
+        # int8 weight + per-tensor scale for the eval-mode int8 GEMM, see to_int8()
+        self.register_buffer("w_int8", None, persistent=False)
+        self.register_buffer("w_scale", None, persistent=False)
+
+    def train(self, mode=True):
+        # weights may be updated again once training resumes, so drop the frozen copies
+        if mode:
+            self._bin_weight = None
+            self.w_int8 = self.w_scale = None
+        return super(BinarizeLinear, self).train(mode)
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # checkpoints from before the parametrization store the weight as plain "weight"
+        if prefix + "weight" in state_dict:
+            state_dict.setdefault(prefix + "parametrizations.weight.original", state_dict.pop(prefix + "weight"))
+        # new weights: drop the frozen copies so they are rebuilt from what is loaded
+        self._bin_weight = None
+        self.w_int8 = self.w_scale = None
+        super(BinarizeLinear, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    @torch.no_grad()
+    def prepare_inference(self):
+        # binarize once; eval-mode forwards then reuse it instead of re-running round/clip per batch.
+        # after to_int8() _bin_weight already holds the dequantized int8 weight; keep that one
+        if self.w_int8 is None:
+            self._bin_weight = self.weight
+        return self
+
+    @torch.no_grad()
+    def to_int8(self):
+        # post-training int8 weights (symmetric, per-tensor scale) for eval; coarser than the
+        # 16-bit Binarize grid, so this is opt-in and only used while the module is in eval mode
+        weight = self.weight
+        self.w_scale = weight.abs().max().clamp(min=1e-8) / 127
+        self.w_int8 = (weight / self.w_scale).round().clamp(-127, 127).to(torch.int8)
+        # keep binarized_weight() (used by LSGRU) consistent with the int8 GEMM
+        self._bin_weight = self.w_int8.float() * self.w_scale
+        return self
+
+    def _int8_linear(self, input):
+        x = input.reshape(-1, self.in_features)
+        x_scale = x.abs().max().clamp(min=1e-8) / 127
+        x_int8 = (x / x_scale).round().clamp(-127, 127).to(torch.int8)
+        m, k, n = x.size(0), self.in_features, self.out_features
+        if not x.is_cuda or (m > 16 and k % 8 == 0 and n % 8 == 0):
+            acc = torch._int_mm(x_int8, self.w_int8.t())  # int8 x int8 -> int32 (VNNI / int8 tensor cores)
+        else:
+            # shapes cuBLASLt's int8 kernel rejects: int8 products summed in fp32 are exact at these sizes
+            acc = nn.functional.linear(x_int8.float(), self.w_int8.float())
+        out = acc.float() * (x_scale * self.w_scale)
+        return out.view(*input.shape[:-1], n)
+
+    def binarized_weight(self):
+        if not self.training:
+            if self._bin_weight is None:
+                self.prepare_inference()
+            return self._bin_weight
+        return self.weight
 
     def forward(self, input):
-        if not hasattr(self.weight, "org"):
-            self.weight.org = self.weight.data.clone()
-        self.weight.data = Binarize(self.weight.org)
-        out = nn.functional.linear(input, self.weight)
+        if not self.training and self.w_int8 is not None:
+            out = self._int8_linear(input)
+        else:
+            # kept out of autocast: the 2**-14 Binarize grid does not survive a cast to bf16
+            with torch.autocast(input.device.type, enabled=False):
+                out = nn.functional.linear(input.float(), self.binarized_weight().float())
         if not self.bias is None:
-            if not hasattr(self.bias, "org"):
-                self.bias.org = self.bias.data.clone()
             out += self.bias.view(1, -1).expand_as(out)
         return out
 
 
-def Get_HexData(binary_tensor):
-    binary_tensor = binary_tensor.to(torch.int)
+HEX_DIGITS = np.array(list("0123456789ABCDEF"))
 
-    flattened = binary_tensor.view(-1)
 
-    if len(flattened) % 4 != 0:
-        padding = torch.zeros(4 - len(flattened) % 4, dtype=torch.int)
-        flattened = torch.cat((flattened, padding))
+def Get_HexData(binary_tensor):
+    bits = binary_tensor.detach().cpu().reshape(-1).to(torch.int).numpy()
 
-    grouped = flattened.view(-1, 4)
-    grouped = torch.flip(grouped, dims=[-1])
+    if len(bits) % 4 != 0:
+        bits = np.concatenate((bits, np.zeros(4 - len(bits) % 4, dtype=bits.dtype)))
 
-    hex_data = []
-    for group in grouped:
-        binary_str = "".join([str(bit.item()) for bit in group])
-        hex_value = hex(int(binary_str, 2))[2:].upper()
-        hex_data.append(hex_value)
+    # each group of 4 bits is read LSB-first (bit i of the group has weight 2**i)
+    grouped = bits.reshape(-1, 4)
+    nibbles = grouped[:, 0] + grouped[:, 1] * 2 + grouped[:, 2] * 4 + grouped[:, 3] * 8
+    hex_data = HEX_DIGITS[nibbles].tolist()
 
     reversed_hex_data = hex_data[::-1]
     print("倒序后的16进制数据:", reversed_hex_data)
@@ -225,19 +374,24 @@ class GRU(nn.Module):
 
     def forward(self, x, hidden_spike=None):
         # x: (batch, seq_length, input_size)
+        B, T, C = x.shape
         if hidden_spike is None:
-            hidden_spike = torch.zeros(x.size(0), self.hidden_size, device=x.device)
+            hidden_spike = torch.zeros(B, self.hidden_size, device=x.device, dtype=x.dtype)
         else:
-            hidden_spike = hidden_spike.squeeze(0)
+            # accepts (B, H) or nn.GRU-style (1, B, H); unlike squeeze(0) this keeps B == 1 intact
+            hidden_spike = hidden_spike.reshape(B, self.hidden_size)
 
-        Encoding_mem = Encoding_spike = (torch.zeros(x.size(0), x.size(1), x.size(2))).to(device)
+        Encoding_mem = Encoding_spike = torch.zeros(B, T, C, device=x.device)
         Encoding_mem, Encoding_spike = LIF_mem_update(x, Encoding_mem, Encoding_spike)
+        # RZGate(cat(x_t, h)) == x_t @ W_x^T + h @ W_h^T (+ b): the input half is projected for all
+        # timesteps at once (time-major, so X_proj[t] is contiguous); each step is one addmm on h
+        W_x, W_h = self.RZGate.weight.split([self.input_size, self.hidden_size], dim=1)
+        X_proj = F.linear(Encoding_spike.transpose(0, 1), W_x, self.RZGate.bias)
         outputs = []
-        for t in range(x.size(1)):
-            X_spike = Encoding_spike[:, t, :]
-            x_in = torch.cat((X_spike, hidden_spike), dim=1).to(device)
-            hidden_spike = torch.sigmoid(self.RZGate(x_in))
-            o_input = self.h2o(hidden_spike)
+        for t in range(T):
+            hidden_spike = torch.sigmoid(torch.addmm(X_proj[t], hidden_spike, W_h.t()))
+        # only the last step's output is returned
+        o_input = self.h2o(hidden_spike)
         return o_input
 
 
@@ -261,23 +415,25 @@ class SGRU(nn.Module):
             w.data.uniform_(-std, std)
 
     def forward(self, x, hidden_spike=None):
+        B, T, C = x.shape
         if hidden_spike is None:
-            hidden_spike = torch.zeros(x.size(0), self.hidden_size, device=x.device)
+            hidden_spike = torch.zeros(B, self.hidden_size, device=x.device, dtype=x.dtype)
         else:
-            hidden_spike = hidden_spike.squeeze(0)
+            hidden_spike = hidden_spike.reshape(B, self.hidden_size)
 
-        Encoding_mem = Encoding_spike = (torch.zeros(x.size(0), x.size(1), x.size(2))).to(device)
-        RZgate_mem = RZgate_spike = torch.zeros(x.size(0), self.hidden_size, device=x.device)
+        Encoding_mem = Encoding_spike = torch.zeros(B, T, C, device=x.device)
+        RZgate_mem = RZgate_spike = torch.zeros(B, self.hidden_size, device=x.device, dtype=x.dtype)
 
         Encoding_mem, Encoding_spike = LIF_mem_update(x, Encoding_mem, Encoding_spike)
+        # input/hidden split of RZGate, see GRU.forward
+        W_x, W_h = self.RZGate.weight.split([self.input_size, self.hidden_size], dim=1)
+        X_proj = F.linear(Encoding_spike.transpose(0, 1), W_x, self.RZGate.bias)
         outputs = []
-        for t in range(x.size(1)):
-            X_spike = Encoding_spike[:, t, :]
-            x_in = torch.cat((X_spike, hidden_spike), dim=1)
-            RZgate_x = self.RZGate(x_in)
+        for t in range(T):
+            RZgate_x = torch.addmm(X_proj[t], hidden_spike, W_h.t())
             RZgate_mem, RZgate_spike = LIF_mem_update(RZgate_x, RZgate_mem, RZgate_spike)
             hidden_spike = RZgate_spike
-            o_input = self.h2o(hidden_spike)
+        o_input = self.h2o(hidden_spike)
         return o_input
 
 
@@ -300,23 +456,28 @@ class LSGRU(nn.Module):
             w.data.uniform_(-std, std)
 
     def forward(self, x, hidden_spike=None):
+        B, T, C = x.shape
         if hidden_spike is None:
-            hidden_spike = torch.zeros(x.size(0), self.hidden_size, device=x.device)
+            hidden_spike = torch.zeros(B, self.hidden_size, device=x.device, dtype=x.dtype)
         else:
-            hidden_spike = hidden_spike.squeeze(0)
+            hidden_spike = hidden_spike.reshape(B, self.hidden_size)
 
-        Encoding_mem = Encoding_spike = (torch.zeros(x.size(0), x.size(1), x.size(2))).to(device)
-        RZgate_mem = RZgate_spike = torch.zeros(x.size(0), self.hidden_size, device=x.device)
+        Encoding_mem = Encoding_spike = torch.zeros(B, T, C, device=x.device)
+        RZgate_mem = RZgate_spike = torch.zeros(B, self.hidden_size, device=x.device, dtype=x.dtype)
 
         Encoding_mem, Encoding_spike = LIF_mem_update(x, Encoding_mem, Encoding_spike)
-        outputs = []
-        for t in range(x.size(1)):
-            X_spike = Encoding_spike[:, t, :]
-            x_in = torch.cat((X_spike, hidden_spike), dim=1)
-            RZgate_x = self.RZGate(x_in)
-            RZgate_mem, RZgate_spike = LIF_mem_update(RZgate_x, RZgate_mem, RZgate_spike)
-            hidden_spike = RZgate_spike
-            o_input = self.h2o(hidden_spike)
+        # input/hidden split of RZGate, see GRU.forward
+        W_x, W_h = self.RZGate.binarized_weight().split([self.input_size, self.hidden_size], dim=1)
+        # binarized weights stay fp32 under autocast, as in BinarizeLinear.forward
+        with torch.autocast(x.device.type, enabled=False):
+            X_proj = F.linear(Encoding_spike.float().transpose(0, 1), W_x.float(), self.RZGate.bias)
+            hidden_spike = hidden_spike.float()
+            outputs = []
+            for t in range(T):
+                RZgate_x = torch.addmm(X_proj[t], hidden_spike, W_h.float().t())
+                RZgate_mem, RZgate_spike = LIF_mem_update(RZgate_x, RZgate_mem, RZgate_spike)
+                hidden_spike = RZgate_spike
+        o_input = self.h2o(hidden_spike)
         return o_input
 
 
@@ -329,13 +490,14 @@ class OLSGRU(nn.Module):
         self.h2o = BinarizeLinear(hidden_size, output_size, bias=bias)
 
     def forward(self, x, hidden_spike=None):
+        B, T, C = x.shape
         if hidden_spike is None:
-            hidden_spike = torch.zeros(x.size(0), self.hidden_size, device=x.device)
+            hidden_spike = torch.zeros(B, self.hidden_size, device=x.device, dtype=x.dtype)
         else:
-            hidden_spike = hidden_spike.squeeze(0)
+            hidden_spike = hidden_spike.reshape(B, self.hidden_size)
 
-        Encoding_mem = Encoding_spike = (torch.zeros(x.size(0), x.size(1), x.size(2))).to(device)
-        RZgate_mem = RZgate_spike = torch.zeros(x.size(0), self.hidden_size, device=x.device)
+        Encoding_mem = Encoding_spike = torch.zeros(B, T, C, device=x.device)
+        RZgate_mem = RZgate_spike = torch.zeros(B, self.hidden_size, device=x.device, dtype=x.dtype)
 
         Encoding_mem, Encoding_spike = LIF_mem_update(x, Encoding_mem, Encoding_spike)
 
@@ -356,7 +518,13 @@ class PositionalEncoding(nn.Module):
         pe[:, 0::2] = torch.sin(position * div_term)
         pe[:, 1::2] = torch.cos(position * div_term)
         pe = pe.unsqueeze(0)
-        self.register_buffer("pe", pe)
+        # deterministic from (max_len, d_model), so it is rebuilt here rather than stored in checkpoints
+        self.register_buffer("pe", pe, persistent=False)
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # older checkpoints carry a (1, 5000, d_model) "pe"; ignore it
+        state_dict.pop(prefix + "pe", None)
+        super(PositionalEncoding, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
 
     def forward(self, x):
         # x shape: (batch_size, time_steps, d_model)
@@ -364,10 +532,11 @@ class PositionalEncoding(nn.Module):
 
 
 class SpeechTransformer(nn.Module):
-    def __init__(self, num_classes=10, d_model=32, nhead=4, num_layers=4, classifier_type="olsgru"):
+    def __init__(self, num_classes=10, d_model=32, nhead=4, num_layers=4, classifier_type="olsgru", max_length=16):
         super(SpeechTransformer, self).__init__()
         self.d_model = d_model
-        self.positional_encoding = PositionalEncoding(d_model)
+        # max_length matches Dataset.max_length: inputs never have more time steps than that
+        self.positional_encoding = PositionalEncoding(d_model, max_len=max_length)
         # input projection (mel_bins -> d_model). If mel_bins==d_model this is identity-like.
         self.input_layer = nn.Linear(d_model, d_model)  # safe identity mapping if sizes equal
 
@@ -404,16 +573,26 @@ class SpeechTransformer(nn.Module):
 # -------------------------
 # Training & feature export (follows notebook flow)
 # -------------------------
-def run_train_and_export(audio_dir: str, save_dir: str, epochs: int = 30):
+def run_train_and_export(audio_dir: str, save_dir: str, epochs: int = 30, precompute: bool = True):
     os.makedirs(save_dir, exist_ok=True)
     dataset = Dataset(audio_dir, transform=True)
+    # mel-spectrograms are computed once here instead of per item in every epoch
+    if precompute:
+        dataset.precompute_all(device)
 
     train_size = int(0.9 * len(dataset))
     test_size = len(dataset) - train_size
     train_dataset, test_dataset = random_split(dataset, [train_size, test_size], generator=GLOBAL_GENERATOR)
 
-    train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True, num_workers=0)
-    test_loader = DataLoader(test_dataset, batch_size=32, shuffle=False, num_workers=0)
+    if dataset.cache is None:
+        # per-item wav decode + mel in worker processes, overlapped with the training step
+        loader_kwargs = dict(num_workers=min(8, os.cpu_count() or 1), pin_memory=device.type == "cuda",
+                             persistent_workers=True, prefetch_factor=4)
+    else:
+        # items are slices of a tensor already on `device`; workers/pinning would only add overhead
+        loader_kwargs = dict(num_workers=0)
+    train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True, **loader_kwargs)
+    test_loader = DataLoader(test_dataset, batch_size=32, shuffle=False, **loader_kwargs)
 
     model = SpeechTransformer().to(device)
 
@@ -421,7 +600,7 @@ def run_train_and_export(audio_dir: str, save_dir: str, epochs: int = 30):
     srnn_path = "/kaggle/working/models/srnn_best_model.pth"
     if os.path.exists(srnn_path):
         try:
-            model.load_state_dict(torch.load(srnn_path))
+            model.load_state_dict(torch.load(srnn_path, map_location=device, mmap=True), assign=True)
             print(f"Loaded pretrained {srnn_path}")
         except Exception as e:
             print("Could not load srnn_best_model.pth:", e)
@@ -432,46 +611,45 @@ def run_train_and_export(audio_dir: str, save_dir: str, epochs: int = 30):
 
     best_val_accuracy = 0.0
 
+    # compiled wrapper for the training step only; `model` itself stays uncompiled so its
+    # state_dict keys are not prefixed with "_orig_mod." and checkpoints load into SpeechTransformer
+    train_model = torch.compile(model) if device.type == "cuda" else model
+
     for epoch in range(epochs):
         model.train()
-        train_loss = 0.0
+        # running sums stay on the device and are read back once per epoch (no per-batch .item() sync)
+        train_loss = torch.zeros((), device=device)
         for inputs, labels in train_loader:
-            inputs, labels = inputs.to(device), labels.to(device)
+            inputs, labels = inputs.to(device, non_blocking=True), labels.to(device, non_blocking=True)
             optimizer.zero_grad()
-            outputs = model(inputs)
-            # In notebook classifier returns (batch, time, dim) for OLSGRU; to compute loss we need logits
-            # In original notebook they later treat outputs as logits; to be faithful we try to reduce to logits:
-            if outputs.ndim == 3:
-                # aggregate over time (mean) to produce (batch, d_model) then map to 10 classes via a linear if needed
-                outputs = outputs.mean(dim=1)
-                # map to 10 classes if dims mismatch
-                if outputs.size(1) != 10:
-                    # create a temporary linear mapper on-the-fly
-                    mapper = nn.Linear(outputs.size(1), 10).to(outputs.device)
-                    outputs = mapper(outputs)
-            loss = criterion(outputs, labels)
+            with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=use_amp):
+                outputs = train_model(inputs)
+            # SpeechTransformer already reduces the classifier output over time and returns (batch, num_classes) logits
+            loss = criterion(outputs.float(), labels)
             loss.backward()
             optimizer.step()
-            train_loss += loss.item()
+            train_loss += loss.detach()
 
         # Validation
         model.eval()
-        val_loss = 0.0
-        correct = 0
+        for m in model.modules():
+            if isinstance(m, BinarizeLinear):
+                m.prepare_inference()
+        val_loss = torch.zeros((), device=device)
+        correct = torch.zeros((), dtype=torch.long, device=device)
         total = 0
         with torch.no_grad():
             for inputs, labels in test_loader:
-                inputs, labels = inputs.to(device), labels.to(device)
+                inputs, labels = inputs.to(device, non_blocking=True), labels.to(device, non_blocking=True)
                 outputs = model(inputs)  # now model returns logits (batch, num_classes)
                 loss = criterion(outputs, labels)
-                val_loss += loss.item()
-                _, predicted = torch.max(outputs, 1)
-                correct += (predicted == labels).sum().item()
+                val_loss += loss
+                correct += (outputs.argmax(1) == labels).sum()
                 total += labels.size(0)
 
-        train_loss_avg = train_loss / len(train_loader)
-        val_loss_avg = val_loss / len(test_loader)
-        val_accuracy = 100 * correct / total
+        train_loss_avg = train_loss.item() / len(train_loader)
+        val_loss_avg = val_loss.item() / len(test_loader)
+        val_accuracy = 100 * correct.item() / total
         print(f"Epoch {epoch+1}, Train Loss: {train_loss_avg:.4f}, Val Loss: {val_loss_avg:.4f}, Val Accuracy: {val_accuracy:.2f}%")
 
         if val_accuracy > best_val_accuracy:
@@ -487,38 +665,32 @@ def run_train_and_export(audio_dir: str, save_dir: str, epochs: int = 30):
     saved_path = os.path.join(save_dir, "lsrnn_best_model.pth")
     if os.path.exists(saved_path):
         try:
-            model.load_state_dict(torch.load(saved_path, map_location=device))
+            model.load_state_dict(torch.load(saved_path, map_location=device, mmap=True), assign=True)
             print(f"Loaded best model from {saved_path}")
         except Exception as e:
             print("Could not load saved best model:", e)
 
-    # prepare to extract features using Tran_Model = SpeechTransformer()
-    Tran_Model = SpeechTransformer().to(device)
-    # try to load saved trained weights into Tran_Model if available
-    if os.path.exists(saved_path):
-        try:
-            Tran_Model.load_state_dict(torch.load(saved_path, map_location=device))
-        except Exception:
-            pass
-
-    all_features = []
-    all_labels = []
+    # features come from `model` itself (the notebook built a second SpeechTransformer, Tran_Model,
+    # and loaded the same checkpoint into it)
+    # filled in place batch by batch; the feature width is known after the first batch
+    all_features = None
+    all_labels = np.empty(len(test_dataset), dtype=np.int64)
+    offset = 0
 
     model.eval()
     with torch.no_grad():
         for inputs, labels in test_loader:
-            inputs, labels = inputs.to(device), labels.to(device)
-            feature = Tran_Model(inputs)
+            inputs, labels = inputs.to(device, non_blocking=True), labels.to(device, non_blocking=True)
+            feature = model(inputs)
             # if 3D, aggregate to (batch, dim)
             if feature.ndim == 3:
                 feature = feature.mean(dim=1)
-            feature_np = feature.cpu().detach().numpy()
-            labels_np = labels.cpu().detach().numpy()
-            all_features.append(feature_np)
-            all_labels.append(labels_np)
-
-    all_features = np.concatenate(all_features, axis=0)
-    all_labels = np.concatenate(all_labels, axis=0)
+            if all_features is None:
+                all_features = np.empty((len(test_dataset), feature.size(1)), dtype=np.float32)
+            batch = labels.size(0)
+            all_features[offset:offset + batch] = feature.cpu().numpy()
+            all_labels[offset:offset + batch] = labels.cpu().numpy()
+            offset += batch
     print(all_features.shape)
     print(all_labels.shape)
     np.save(os.path.join(save_dir, "FSDD_test_data.npy"), all_features)
@@ -534,6 +706,8 @@ def parse_args():
     p.add_argument("--data_dir", type=str, default=DEFAULT_AUDIO_DIR, help="Path to recordings/ (wav files)")
     p.add_argument("--save_dir", type=str, default=DEFAULT_SAVE_DIR, help="Directory to save models/features")
     p.add_argument("--epochs", type=int, default=30)
+    p.add_argument("--no_precompute", action="store_true",
+                   help="Compute mel-spectrograms per item in DataLoader workers instead of caching them up front")
     return p.parse_args()
 
 
@@ -541,4 +715,4 @@ if __name__ == "__main__":
     args = parse_args()
     print("Device:", device)
     print("Using data dir:", args.data_dir)
-    run_train_and_export(args.data_dir, args.save_dir, epochs=args.epochs)
\ No newline at end of file
+    run_train_and_export(args.data_dir, args.save_dir, epochs=args.epochs, precompute=not args.no_precompute)
\ No newline at end of file